@@ -1,5 +1,27 @@
 from crewai import Agent, LLM
+from functools import cached_property
+from tasks import FastPlan
 import os
+import threading
+
+_shared_llms = {}
+_llm_lock = threading.Lock()
+
+
+def get_llm(model, api_key, **params):
+    """
+    Return the process-wide LLM for this configuration.
+
+    Each LLM owns one provider client, so sharing the LLM lets agent calls
+    reuse that client's open connections instead of paying a TLS handshake
+    each time.
+    """
+    key = (model, api_key, repr(sorted(params.items())))
+    with _llm_lock:
+        if key not in _shared_llms:
+            _shared_llms[key] = LLM(model=model, api_key=api_key, **params)
+        return _shared_llms[key]
+
 
 class ItineraAgents:
     def __init__(self, model="gemini/gemini-2.5-flash", api_key=None):
@@ -9,21 +31,12 @@ class ItineraAgents:
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY not found")
         
-        self.llm = LLM(
-            model=model, 
-            temperature=0.6,
-            api_key=self.api_key
-        )
+        self.llm = get_llm(model, self.api_key, temperature=0.6)
 
-        self.prompt_parser_agent = self._create_prompt_parser_agent()
-        self.city_selector_agent = self._create_city_selector_agent()
-        self.transport_agent = self._create_transport_agent()
-        self.local_expert_agent = self._create_local_expert_agent()
-        self.budget_manager_agent = self._create_budget_manager_agent()
-        self.budget_checker_agent = self._create_budget_checker_agent()
-        self.itinerary_agent = self._create_itinerary_agent()
+    # Agents are built on first use and then reused for every request
 
-    def _create_prompt_parser_agent(self):
+    @cached_property
+    def prompt_parser_agent(self):
         return Agent(
             role='Travel Request Parser',
             goal='Extract structured travel parameters from natural language requests',
@@ -36,7 +49,8 @@ class ItineraAgents:
             verbose=False
         )
 
-    def _create_city_selector_agent(self):
+    @cached_property
+    def city_selector_agent(self):
         return Agent(
             role='City Selection Expert',
             goal='Identify affordable and realistic destinations based on constraints',
@@ -48,7 +62,8 @@ class ItineraAgents:
             verbose=False
         )
 
-    def _create_transport_agent(self):
+    @cached_property
+    def transport_agent(self):
         return Agent(
             role='Transportation Specialist',
             goal='Determine cost-effective and efficient transportation options',
@@ -60,7 +75,8 @@ class ItineraAgents:
             verbose=False
         )
 
-    def _create_local_expert_agent(self):
+    @cached_property
+    def local_expert_agent(self):
         return Agent(
             role='Local Experience Consultant',
             goal='Recommend affordable and enriching local activities',
@@ -72,7 +88,8 @@ class ItineraAgents:
             verbose=False
         )
 
-    def _create_budget_manager_agent(self):
+    @cached_property
+    def budget_manager_agent(self):
         return Agent(
             role='Budget Manager',
             goal='Ensure trip components stay within budget while maximizing value',
@@ -84,7 +101,8 @@ class ItineraAgents:
             verbose=False
         )
 
-    def _create_budget_checker_agent(self):
+    @cached_property
+    def budget_checker_agent(self):
         return Agent(
             role='Budget Compliance Checker',
             goal='Validate that plans adhere to budget constraints',
@@ -96,7 +114,8 @@ class ItineraAgents:
             verbose=False
         )
 
-    def _create_itinerary_agent(self):
+    @cached_property
+    def itinerary_agent(self):
         return Agent(
             role='Itinerary Planner',
             goal='Create detailed and cohesive travel itineraries',
@@ -106,4 +125,29 @@ class ItineraAgents:
             ),
             llm=self.llm,
             verbose=False
-        )
\ No newline at end of file
+        )
+
+    @cached_property
+    def json_llm(self):
+        # Gemini structured output constrained to the FastPlan schema, so
+        # single-shot plans come back as JSON of the expected shape
+        return get_llm(
+            self.model,
+            self.api_key,
+            temperature=0.6,
+            response_format=FastPlan
+        )
+
+    @cached_property
+    def trip_planner_agent(self):
+        return Agent(
+            role='End-to-End Trip Planner',
+            goal='Produce a complete, budget-compliant travel plan in a single pass',
+            backstory=(
+                "A seasoned travel consultant who combines the skills of a destination selector, local expert, "
+                "transportation specialist, itinerary planner, and budget manager. "
+                "Known for realistic cost estimates, authentic local experiences, and plans that respect the traveler's budget."
+            ),
+            llm=self.json_llm,
+            verbose=False
+        )
@@ -1,12 +1,21 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field, StringConstraints, field_validator
+from typing import Annotated, Literal, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 import uuid
-import json
+import asyncio
+import contextvars
+import orjson
 import os
 import sys
+import threading
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -15,7 +24,36 @@ sys.path.insert(0, str(backend_dir))
 
 load_dotenv()
 
-from flow import TravelPlannerFlow
+# Id of the job whose plan is being generated, so interleaved progress from
+# concurrent jobs can be told apart
+current_job = contextvars.ContextVar("current_job", default="-")
+
+
+class JobContextFilter(logging.Filter):
+    def filter(self, record):
+        record.job = current_job.get()
+        return True
+
+
+# Workers only enqueue log records; a single listener thread writes them out.
+# The job id is stamped on the emitting thread, where its context is visible.
+log_queue = queue.SimpleQueue()
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(job)s]: %(message)s"))
+log_listener = QueueListener(log_queue, log_handler)
+
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(JobContextFilter())
+itinera_logger = logging.getLogger("itinera")
+itinera_logger.setLevel(os.getenv("ITINERA_LOG_LEVEL", "INFO").upper())
+itinera_logger.addHandler(queue_handler)
+itinera_logger.propagate = False
+log_listener.start()
+logger = logging.getLogger("itinera.api")
+
+from flow import WORKER_PROCESSES, get_flow, per_worker
+from cache import get_embedding_model
+import store
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
@@ -24,10 +62,20 @@ if not GEMINI_API_KEY:
         "Create a .env file with: GEMINI_API_KEY=your_key_here"
     )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the cache's embedding model once per process, in the background, so
+    # the first request does not pay for it and all worker threads share it
+    threading.Thread(target=get_embedding_model, daemon=True).start()
+    yield
+    plan_executor.shutdown(wait=False, cancel_futures=True)
+    log_listener.stop()
+
 app = FastAPI(
     title="Itinera Travel Planner API",
     description="AI-powered travel itinerary planning with budget validation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -38,28 +86,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for demo (use database in production)
-plans_store: Dict[str, Dict[str, Any]] = {}
-jobs_store: Dict[str, Dict[str, Any]] = {}
+# Plan generation is network-bound on the LLM, so a bounded thread pool gives
+# parallel plans without blocking the event loop; the job slots add backpressure.
+# Both caps are server-wide totals split across worker processes (see
+# flow.per_worker).
+MAX_WORKERS = per_worker(int(os.getenv("ITINERA_MAX_WORKERS", min(8, (os.cpu_count() or 1) * 2))))
+MAX_PENDING_JOBS = per_worker(int(os.getenv("ITINERA_MAX_PENDING_JOBS", MAX_WORKERS * WORKER_PROCESSES * 4)))
+
+plan_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="itinera-plan")
+job_slots = threading.BoundedSemaphore(MAX_PENDING_JOBS)
+
+PLANS_DIR = Path("generated_plans")
+PLANS_DIR.mkdir(exist_ok=True)
 
 class TravelRequest(BaseModel):
     prompt: str = Field(..., min_length=10, max_length=1000, description="Natural language travel request")
 
+Season = Literal['summer', 'winter', 'monsoon', 'spring', 'autumn']
+
 class TravelRequestStructured(BaseModel):
-    interests: str = Field(..., min_length=3, max_length=200)
+    interests: Annotated[str, StringConstraints(strip_whitespace=True, min_length=3, max_length=200)]
     budget: int = Field(..., gt=0)
     duration: int = Field(..., ge=1, le=30)
     start_city: str = Field(..., min_length=2, max_length=100)
-    season: str = Field(...)
+    season: Season
     people: int = Field(..., ge=1, le=20)
     currency: Optional[str] = Field("INR")
     
-    @validator('season')
-    def validate_season(cls, v):
-        valid_seasons = ['summer', 'winter', 'monsoon', 'spring', 'autumn']
-        if v.lower() not in valid_seasons:
-            raise ValueError(f'Season must be one of: {", ".join(valid_seasons)}')
-        return v.lower()
+    @field_validator('season', mode='before')
+    @classmethod
+    def normalize_season(cls, v):
+        return v.lower() if isinstance(v, str) else v
 
 class PlanResponse(BaseModel):
     plan_id: str
@@ -81,51 +138,65 @@ class JobStatus(BaseModel):
     created_at: str
     completed_at: Optional[str] = None
 
+def _write_plan(plan_id: str, plan: Dict[str, Any]):
+    (PLANS_DIR / f"{plan_id}.json").write_bytes(orjson.dumps(plan, option=orjson.OPT_INDENT_2))
+
+def _save_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    plan_id = str(uuid.uuid4())
+    
+    budget_limit = plan.get("budget", {}).get("budget_limit") or plan.get("metadata", {}).get("budget_limit", 0)
+    
+    result = {
+        "plan_id": plan_id,
+        "status": "completed",
+        "destination": plan["destination"]["city"],
+        "total_cost": plan["budget"]["total_cost"],
+        "budget_limit": budget_limit,  # Fixed
+        "within_budget": plan["budget"]["within_budget"],
+        "created_at": datetime.now().isoformat(),
+        "plan_data": plan
+    }
+    
+    store.put_plan(plan_id, result)
+    _write_plan(plan_id, plan)
+    
+    return result
+
 def generate_plan_sync(job_id: str, request: TravelRequest):
+    token = current_job.set(job_id)
     try:
-        jobs_store[job_id]["status"] = "processing"
+        store.update_job(job_id, status="processing")
         
-        flow = TravelPlannerFlow()
+        flow = get_flow()
         plan = flow.run_from_prompt(request.prompt)
         
-        plan_id = str(uuid.uuid4())
-        
-        budget_limit = plan.get("budget", {}).get("budget_limit") or plan.get("metadata", {}).get("budget_limit", 0)
+        result = _save_plan(plan)
         
-        plans_store[plan_id] = {
-            "plan_id": plan_id,
-            "status": "completed",
-            "destination": plan["destination"]["city"],
-            "total_cost": plan["budget"]["total_cost"],
-            "budget_limit": budget_limit,  # Fixed
-            "within_budget": plan["budget"]["within_budget"],
-            "created_at": datetime.now().isoformat(),
-            "plan_data": plan
-        }
-        
-        jobs_store[job_id].update({
-            "status": "completed",
-            "plan_id": plan_id,
-            "completed_at": datetime.now().isoformat()
-        })
-        
-        plans_dir = Path("generated_plans")
-        plans_dir.mkdir(exist_ok=True)
-        with open(plans_dir / f"{plan_id}.json", "w") as f:
-            json.dump(plan, f, indent=2)
+        store.update_job(
+            job_id,
+            status="completed",
+            plan_id=result["plan_id"],
+            completed_at=datetime.now().isoformat()
+        )
             
     except ValueError as e:
-        jobs_store[job_id].update({
-            "status": "failed",
-            "error": str(e),
-            "completed_at": datetime.now().isoformat()
-        })
+        logger.warning("Plan failed: %s", e)
+        store.update_job(
+            job_id,
+            status="failed",
+            error=str(e),
+            completed_at=datetime.now().isoformat()
+        )
     except Exception as e:
-        jobs_store[job_id].update({
-            "status": "failed",
-            "error": f"Unexpected error: {str(e)}",
-            "completed_at": datetime.now().isoformat()
-        })
+        logger.exception("Plan failed unexpectedly")
+        store.update_job(
+            job_id,
+            status="failed",
+            error=f"Unexpected error: {str(e)}",
+            completed_at=datetime.now().isoformat()
+        )
+    finally:
+        current_job.reset(token)
 
 @app.get("/")
 def root():
@@ -136,44 +207,54 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "POST /plan": "Create travel plan (async)",
+            "GET /plan/stream?prompt=...": "Create travel plan, streaming step results (SSE)",
             "GET /plan/{plan_id}": "Get plan by ID",
             "GET /job/{job_id}": "Check job status"
         }
     }
 
 @app.post("/plan", response_model=JobStatus, status_code=202)
-async def create_plan(request: TravelRequest, background_tasks: BackgroundTasks):
+async def create_plan(request: TravelRequest):
     """
     Create a travel plan (async processing)
     
     Returns a job ID to track the plan generation progress.
     """
+    if not job_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Too many plans in progress, try again shortly")
+    
     job_id = str(uuid.uuid4())
     
-    jobs_store[job_id] = {
+    job = {
         "job_id": job_id,
         "status": "pending",
         "created_at": datetime.now().isoformat(),
-        "request": request.dict()
+        "request": request.model_dump()
     }
+    # SQLite writes can wait on a busy lock, so they stay off the event loop
+    try:
+        await asyncio.to_thread(store.put_job, job_id, job)
+    except BaseException:
+        job_slots.release()
+        raise
     
-    background_tasks.add_task(generate_plan_sync, job_id, request)
+    future = plan_executor.submit(generate_plan_sync, job_id, request)
+    future.add_done_callback(lambda _: job_slots.release())
     
     return JobStatus(
         job_id=job_id,
         status="pending",
         message="Plan generation started. Check /job/{job_id} for status.",
-        created_at=jobs_store[job_id]["created_at"]
+        created_at=job["created_at"]
     )
 
 @app.get("/job/{job_id}", response_model=JobStatus)
 def get_job_status(job_id: str):
     """Check the status of a plan generation job"""
-    if job_id not in jobs_store:
+    job = store.get_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    job = jobs_store[job_id]
-    
     return JobStatus(
         job_id=job_id,
         status=job["status"],
@@ -184,43 +265,62 @@ def get_job_status(job_id: str):
         completed_at=job.get("completed_at")
     )
 
+def _sse(event: Dict[str, Any]) -> str:
+    return f"data: {orjson.dumps(event).decode()}\n\n"
+
+# Registered before /plan/{plan_id} so "stream" is not taken as a plan ID
+@app.get("/plan/stream")
+async def stream_plan(prompt: str = Query(..., min_length=10, max_length=1000)):
+    """
+    Create a travel plan, streaming each completed step as a Server-Sent Event
+    
+    The final event is {"step": "done", "plan_id": ...}; failures end the
+    stream with {"step": "error", "error": ...}.
+    """
+    # Streamed plans run in this process too, so they count against the
+    # same job slots as POST /plan
+    if not job_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Too many plans in progress, try again shortly")
+    
+    async def events():
+        try:
+            async for event in get_flow().run_stream(prompt):
+                if event["step"] == "plan":
+                    result = await asyncio.to_thread(_save_plan, event["data"])
+                    event = {"step": "done", "plan_id": result["plan_id"]}
+                yield _sse(event)
+        except ValueError as e:
+            yield _sse({"step": "error", "error": str(e)})
+        except Exception as e:
+            yield _sse({"step": "error", "error": f"Plan generation failed: {str(e)}"})
+        finally:
+            job_slots.release()
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.get("/plan/{plan_id}", response_model=PlanResponse)
-def get_plan(plan_id: str):
+def get_plan(plan_id: str, request: Request):
     """Retrieve a generated travel plan by ID"""
-    if plan_id not in plans_store:
+    record = store.get_plan_blob(plan_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Plan not found")
     
-    plan = plans_store[plan_id]
+    # Plans are immutable, so the stored JSON is served as-is and repeat
+    # fetches with a matching ETag get an empty 304
+    blob, etag = record
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    return PlanResponse(**plan)
+    return Response(content=blob, media_type="application/json", headers={"ETag": etag})
 
 @app.post("/plan/sync", response_model=PlanResponse)
 def create_plan_sync(request: TravelRequest):
     try:
-        flow = TravelPlannerFlow()
+        flow = get_flow()
         plan = flow.run_from_prompt(request.prompt)
         
-        plan_id = str(uuid.uuid4())
-        
-        budget_limit = plan.get("budget", {}).get("budget_limit") or plan.get("metadata", {}).get("budget_limit", 0)
-        
-        result = {
-            "plan_id": plan_id,
-            "status": "completed",
-            "destination": plan["destination"]["city"],
-            "total_cost": plan["budget"]["total_cost"],
-            "budget_limit": budget_limit,  # Fixed
-            "within_budget": plan["budget"]["within_budget"],
-            "created_at": datetime.now().isoformat(),
-            "plan_data": plan
-        }
-        
-        plans_store[plan_id] = result
-        
-        plans_dir = Path("generated_plans")
-        plans_dir.mkdir(exist_ok=True)
-        with open(plans_dir / f"{plan_id}.json", "w") as f:
-            json.dump(plan, f, indent=2)
+        result = _save_plan(plan)
         
         return PlanResponse(**result)
         
@@ -232,18 +332,15 @@ def create_plan_sync(request: TravelRequest):
 @app.get("/plans", response_model=list[dict])
 def list_plans(limit: int = 10):
     """List all generated plans"""
-    plans = list(plans_store.values())
-    return plans[-limit:]  
+    return store.list_plans(limit)
 
 @app.delete("/plan/{plan_id}")
 def delete_plan(plan_id: str):
     """Delete a plan"""
-    if plan_id not in plans_store:
+    if not store.delete_plan(plan_id):
         raise HTTPException(status_code=404, detail="Plan not found")
     
-    del plans_store[plan_id]
-    
-    plan_file = Path("generated_plans") / f"{plan_id}.json"
+    plan_file = PLANS_DIR / f"{plan_id}.json"
     if plan_file.exists():
         plan_file.unlink()
     
@@ -251,4 +348,20 @@ def delete_plan(plan_id: str):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Plans and jobs live in SQLite, so workers can run as separate processes.
+    # Plans spend their time waiting on the LLM in threads rather than on CPU,
+    # so two processes are enough by default and each keeps a useful share of
+    # the concurrency caps. Worker processes inherit ITINERA_WORKERS and size
+    # their caps from it.
+    workers = int(os.getenv("ITINERA_WORKERS", 2))
+    os.environ["ITINERA_WORKERS"] = str(workers)
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        log_level="info",
+        reload=False
+    )
\ No newline at end of file
@@ -0,0 +1,210 @@
+import orjson
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_PATH = Path(os.getenv("ITINERA_CACHE_PATH", "semantic_cache.db"))
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+BUDGET_BUCKET = 5000
+
+_models = {}
+_model_lock = threading.Lock()
+
+
+def get_embedding_model(model_name=EMBEDDING_MODEL):
+    """
+    Return the process-wide sentence-transformers model, loading it once.
+
+    Returns None when sentence-transformers is not installed.
+    """
+    if model_name not in _models:
+        with _model_lock:
+            if model_name not in _models:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    _models[model_name] = None
+                else:
+                    _models[model_name] = SentenceTransformer(model_name, device="cpu")
+    return _models[model_name]
+
+
+def make_cache_key(step, **fields):
+    """
+    Build a canonical cache key for a pipeline step.
+
+    Strings are lowercased, comma-separated interests are sorted and budgets are
+    rounded to the nearest bucket so near-identical trips share a key.
+    """
+    parts = [step]
+    for name in sorted(fields):
+        value = fields[name]
+        if name == 'interests' and isinstance(value, str):
+            value = ", ".join(sorted(i.strip() for i in value.lower().split(",") if i.strip()))
+        elif name == 'budget' and isinstance(value, (int, float)):
+            value = int(round(value / BUDGET_BUCKET) * BUDGET_BUCKET)
+        elif isinstance(value, str):
+            value = value.strip().lower()
+        parts.append(f"{name}={value}")
+    return "|".join(parts)
+
+
+def _split_cache_key(key):
+    """
+    Split a cache key into its exact-match scope and its interests text.
+
+    The scope is the key without its interests field; the interests text is
+    None for keys that have no such field.
+    """
+    parts = key.split("|")
+    interests = None
+    scope = []
+    for part in parts:
+        if part.startswith("interests="):
+            interests = part[len("interests="):]
+        else:
+            scope.append(part)
+    return "|".join(scope), interests
+
+
+class SemanticCache:
+    """
+    SQLite-backed cache of parsed agent outputs.
+
+    Lookups try the exact key first (in memory, then on disk). Callers that
+    ask for a fuzzy match also get the stored entry whose interests are
+    closest by embedding similarity, among entries whose every other field
+    matches exactly; free-text interests are the only part of a key where
+    near enough is the same trip. Entries expire ``ttl`` seconds after they
+    are stored. Without sentence-transformers installed the cache still
+    serves exact key matches.
+    """
+
+    def __init__(self, path=CACHE_PATH, threshold=0.95, model_name=EMBEDDING_MODEL, memory_size=256,
+                 ttl=30 * 24 * 3600, max_candidates=256):
+        self.path = str(path)
+        self.threshold = threshold
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_candidates = max_candidates
+        self._memory = OrderedDict()
+        self._embeddings = OrderedDict()
+        # Guards the in-memory maps only; each thread has its own connection
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._connect()
+        # Entries from before scoped, timestamped keys are dropped; the cache
+        # is disposable, so it starts over rather than migrating them
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 2:
+            conn.execute("DROP TABLE IF EXISTS entries")
+            conn.execute("PRAGMA user_version = 2")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, scope TEXT NOT NULL, embedding BLOB, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_scope ON entries(scope, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries(created_at)")
+
+    def _connect(self):
+        # Server workers share the cache file, so it is opened in WAL mode
+        # like the plan store, and writers wait out each other's locks
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _embed(self, text):
+        model = get_embedding_model(self.model_name)
+        if model is None:
+            return None
+        return model.encode(text, normalize_embeddings=True).astype("float32")
+
+    def get(self, key, fuzzy=False):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        oldest = time.time() - self.ttl
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value FROM entries WHERE key = ? AND created_at >= ?", (key, oldest)
+        ).fetchone()
+        if row:
+            value = orjson.loads(row[0])
+            with self._lock:
+                self._remember(key, value)
+            return value
+
+        scope, interests = _split_cache_key(key)
+        if not fuzzy or interests is None:
+            return None
+
+        embedding = self._embed(interests)
+        if embedding is None:
+            return None
+        with self._lock:
+            # A miss is usually followed by set() for the same key
+            self._remember_embedding(key, embedding)
+
+        import numpy as np
+
+        # Only the most recent candidates are scored, so a miss costs the
+        # same however large the cache grows
+        rows = conn.execute(
+            "SELECT key, embedding FROM entries WHERE scope = ? AND embedding IS NOT NULL AND created_at >= ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (scope, oldest, self.max_candidates)
+        ).fetchall()
+        if not rows:
+            return None
+        candidates = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        scores = candidates @ embedding
+        best = int(scores.argmax())
+        if scores[best] < self.threshold:
+            return None
+
+        row = conn.execute("SELECT value FROM entries WHERE key = ?", (rows[best][0],)).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _remember_embedding(self, key, embedding):
+        self._embeddings[key] = embedding
+        if len(self._embeddings) > self.memory_size:
+            self._embeddings.popitem(last=False)
+
+    def set(self, key, value, fuzzy=False):
+        """
+        Store value under key. Only entries stored with ``fuzzy`` get an
+        embedding, so only they can answer fuzzy lookups.
+        """
+        scope, interests = _split_cache_key(key)
+        embedding = None
+        if fuzzy and interests is not None:
+            with self._lock:
+                embedding = self._embeddings.pop(key, None)
+            if embedding is None:
+                embedding = self._embed(interests)
+
+        with self._lock:
+            self._remember(key, value)
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, scope, embedding, value, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, scope, embedding.tobytes() if embedding is not None else None, orjson.dumps(value).decode(), now)
+        )
+        conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
@@ -1,15 +1,120 @@
-from crewai import Crew, Process
+import asyncio
 from agents import ItineraAgents
-from tasks import ItineraTasks
-import json
+from tasks import ItineraTasks, TripInputs, PIPELINE_STEPS
+from cache import SemanticCache, make_cache_key
 import os
+import re
+import orjson
 from datetime import datetime
-import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+logger = logging.getLogger("itinera.flow")
+
+# Each server worker process holds its own copy of the concurrency caps, so
+# configured caps are totals for the whole server and every process enforces
+# an equal share of them. ITINERA_WORKERS must match the worker count the
+# server is started with; api.py sets it when it launches uvicorn itself.
+WORKER_PROCESSES = max(1, int(os.getenv("ITINERA_WORKERS", 1)))
+
+
+def per_worker(total, minimum=1):
+    """Return this process's share of a server-wide cap, at least ``minimum``."""
+    return max(minimum, total // WORKER_PROCESSES)
+
+
+# Caps concurrent LLM calls across all plans to stay within the provider's
+# rate limits. Each process keeps at least two so research and transport, the
+# steps a plan runs side by side, can still overlap; with more workers than
+# half the total the server as a whole may exceed it.
+MAX_LLM_CALLS = per_worker(int(os.getenv("ITINERA_MAX_LLM_CALLS", 8)), minimum=2)
+_llm_slots = threading.BoundedSemaphore(MAX_LLM_CALLS)
+
+VALID_SEASONS = frozenset({'summer', 'winter', 'monsoon', 'spring', 'autumn'})
+SEASON_BY_MONTH = {
+    12: 'winter', 1: 'winter', 2: 'winter',
+    3: 'summer', 4: 'summer', 5: 'summer',
+    6: 'monsoon', 7: 'monsoon', 8: 'monsoon', 9: 'monsoon',
+    10: 'autumn', 11: 'autumn',
+}
+
+# Short, low-budget trips are planned with one LLM call instead of the
+# full multi-agent pipeline
+FAST_PATH_MAX_DURATION = 3
+FAST_PATH_MAX_BUDGET = 30000
+
+# Itemized cost sections produced by the budget planner
+BUDGET_CATEGORIES = ('transportation', 'accommodation', 'meals', 'activities', 'emergency_fund', 'visa_fees')
+# Relative gap between the plan's own total and its itemized sum that sends
+# the plan to the LLM budget checker
+BUDGET_DISCREPANCY_TOLERANCE = 0.05
+
+# Cost floors (INR) used to reject infeasible requests and unrealistic plans
+MIN_DAILY_COST_PER_PERSON = 1500
+MIN_REALISTIC_DAILY_COST_PER_PERSON = 1000
+MIN_ACCOMMODATION_PER_NIGHT = 800
+MIN_MEAL_COST = 150
+MEALS_PER_DAY = 3
+MIN_DAILY_MEALS_PER_PERSON = MEALS_PER_DAY * MIN_MEAL_COST
+
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(\{.*?\}|\[.*?\])\s*```", re.DOTALL)
+
+
+def _sum_costs(value):
+    if isinstance(value, dict):
+        value = value.get('cost', 0)
+    if isinstance(value, list):
+        return sum(_sum_costs(item) for item in value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return 0
+
+
+def _has_unpriced_items(items):
+    # _sum_costs counts these as 0, which would pass for a too-low estimate
+    for item in items:
+        cost = item.get('cost', 0) if isinstance(item, dict) else item
+        if isinstance(cost, bool) or not isinstance(cost, (int, float)):
+            return True
+    return False
+
+
+def _run_sync(coro):
+    """Run a coroutine from sync code, even when called inside a running event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+def _execute_task(task, agent, context=None):
+    with _llm_slots:
+        return task.execute_sync(agent=agent, context=context)
+
+
+_flow = None
+_flow_lock = threading.Lock()
+
+
+def get_flow():
+    """Return the process-wide TravelPlannerFlow, creating it on first use."""
+    global _flow
+    if _flow is None:
+        with _flow_lock:
+            if _flow is None:
+                _flow = TravelPlannerFlow()
+    return _flow
+
 
 class TravelPlannerFlow:
     def __init__(self, model="gemini/gemini-2.5-flash", api_key=None):
         self.agents = ItineraAgents(model=model, api_key=api_key)
         self.tasks = ItineraTasks()
+        self.cache = SemanticCache()
         
     def validate_inputs(self, inputs):
         if not inputs.get('start_city'):
@@ -17,39 +122,32 @@ class TravelPlannerFlow:
 
         if not inputs.get('budget') or inputs['budget'] <= 0:
             inputs['budget'] = 50000
-            print("  Budget not specified, defaulting to ₹50,000")
+            logger.info("Budget not specified, defaulting to ₹50,000")
 
         if not inputs.get('duration') or inputs['duration'] <= 0:
             inputs['duration'] = 7
-            print("  Duration not specified, defaulting to 7 days")
+            logger.info("Duration not specified, defaulting to 7 days")
 
         if not inputs.get('people') or inputs['people'] <= 0:
             inputs['people'] = 1
-            print("  Travelers not specified, defaulting to 1")
+            logger.info("Travelers not specified, defaulting to 1")
 
         if not inputs.get('interests'):
             inputs['interests'] = 'sightseeing, local culture, food'
-            print("  Interests not specified, defaulting to general sightseeing")
-
-        valid_seasons = ['summer', 'winter', 'monsoon', 'spring', 'autumn']
-        if (inputs.get('season') or '').lower() not in valid_seasons:
-            month = datetime.now().month
-            if month in [12, 1, 2]:
-                inputs['season'] = 'winter'
-            elif month in [3, 4, 5]:
-                inputs['season'] = 'summer'
-            elif month in [6, 7, 8, 9]:
-                inputs['season'] = 'monsoon'
-            else:
-                inputs['season'] = 'autumn'
-            print(f"  Season not specified, using current: {inputs['season']}")
+            logger.info("Interests not specified, defaulting to general sightseeing")
+
+        season = (inputs.get('season') or '').lower()
+        if season in VALID_SEASONS:
+            inputs['season'] = season
+        else:
+            inputs['season'] = SEASON_BY_MONTH[datetime.now().month]
+            logger.info("Season not specified, using current: %s", inputs['season'])
 
         if 'currency' not in inputs:
             inputs['currency'] = 'INR'
 
     def validate_feasibility(self, inputs):
-        min_daily_cost_per_person = 1500
-        min_total = inputs['people'] * inputs['duration'] * min_daily_cost_per_person
+        min_total = inputs['people'] * inputs['duration'] * MIN_DAILY_COST_PER_PERSON
         
         if inputs['budget'] < min_total:
             return {
@@ -62,87 +160,163 @@ class TravelPlannerFlow:
         
         return {'feasible': True}
     
+    def validate_budget_plan(self, budget_plan, limit, currency='INR'):
+        """
+        Check an itemized budget plan against the limit with plain arithmetic.
+
+        Flags are raised when the items cannot be summed or the sum disagrees
+        with the plan's own total; callers hand those plans to the LLM checker.
+        """
+        categories = {
+            name: _sum_costs(budget_plan[name])
+            for name in BUDGET_CATEGORIES
+            if name in budget_plan
+        }
+        computed_total = sum(categories.values())
+        original_total = budget_plan.get('total_estimated_cost')
+        
+        flags = []
+        discrepancy = 0
+        if computed_total <= 0:
+            flags.append("No itemized costs found in budget plan")
+        elif isinstance(original_total, (int, float)):
+            discrepancy = computed_total - original_total
+            if abs(discrepancy) > computed_total * BUDGET_DISCREPANCY_TOLERANCE:
+                flags.append(
+                    f"Plan total {original_total} {currency} differs from itemized sum {computed_total} {currency}"
+                )
+        
+        over_by = max(0, computed_total - limit)
+        recommendations = []
+        if over_by:
+            largest = max(categories, key=categories.get)
+            recommendations.append(f"Reduce {largest.replace('_', ' ')} costs by about {over_by} {currency} to fit the budget")
+        suggestions = budget_plan.get('cost_cutting_suggestions')
+        if isinstance(suggestions, list):
+            recommendations.extend(suggestions)
+        
+        return {
+            "currency": currency,
+            "verified_at": datetime.now().isoformat(),
+            "categories": categories,
+            "computed_total": computed_total,
+            "original_total_in_plan": original_total,
+            "discrepancy": discrepancy,
+            "within_budget": 0 < computed_total <= limit,
+            "over_by": over_by,
+            "flags": flags,
+            "recommendations": recommendations
+        }
+    
     def validate_budget_realistic(self, plan, inputs):
+        """Sanity-check a budget plan against per-person cost floors."""
         budget_data = plan.get('budget', {}).get('plan', {})
         total = plan.get('budget', {}).get('total_cost', 0)
         
         issues = []
         
-        min_per_person_per_day = 1000
-        min_expected = inputs['people'] * inputs['duration'] * min_per_person_per_day
+        person_days = inputs['people'] * inputs['duration']
+        min_expected = person_days * MIN_REALISTIC_DAILY_COST_PER_PERSON
         
         if total < min_expected:
             issues.append(f"Total {total} INR unrealistically low. Minimum: {min_expected} INR")
         
-        if 'accommodation' in budget_data:
-            acc_items = budget_data['accommodation']
-            if isinstance(acc_items, list) and len(acc_items) > 0:
-                acc_total = sum(item.get('cost', 0) for item in acc_items)
-                min_acc = inputs['duration'] * 800
-                if acc_total < min_acc:
-                    issues.append(f"Accommodation {acc_total} INR too low. Minimum: {min_acc} INR")
+        acc_items = budget_data.get('accommodation')
+        if isinstance(acc_items, list) and acc_items:
+            acc_total = _sum_costs(acc_items)
+            min_acc = inputs['duration'] * MIN_ACCOMMODATION_PER_NIGHT
+            if _has_unpriced_items(acc_items):
+                issues.append("Accommodation has items without a numeric cost")
+            elif acc_total < min_acc:
+                issues.append(f"Accommodation {acc_total} INR too low. Minimum: {min_acc} INR")
         
-        if 'meals' in budget_data:
-            meal_items = budget_data['meals']
-            if isinstance(meal_items, list):
-                meal_total = sum(item.get('cost', 0) for item in meal_items)
-                min_meals = inputs['people'] * inputs['duration'] * 3 * 150
-                if meal_total < min_meals:
-                    issues.append(f"Meal cost {meal_total} INR too low. Expected: {min_meals} INR")
+        meal_items = budget_data.get('meals')
+        if isinstance(meal_items, list):
+            meal_total = _sum_costs(meal_items)
+            min_meals = person_days * MIN_DAILY_MEALS_PER_PERSON
+            if _has_unpriced_items(meal_items):
+                issues.append("Meals have items without a numeric cost")
+            elif meal_total < min_meals:
+                issues.append(f"Meal cost {meal_total} INR too low. Expected: {min_meals} INR")
         
         return {
-            'realistic': len(issues) == 0,
+            'realistic': not issues,
             'issues': issues
         }
     
     def run_from_prompt(self, prompt, max_retries=2):
+        """
+        Generate travel plan from natural language prompt
+
+        Args:
+            prompt: Natural language travel request (e.g., "Plan a 5-day beach vacation from Mumbai under 40k")
+            max_retries: Number of retry attempts if budget validation fails
+        """
+        return _run_sync(self.run_from_prompt_async(prompt, max_retries))
+
+    async def run_from_prompt_async(self, prompt, max_retries=2, on_step=None):
         for attempt in range(max_retries):
             try:
-                """
-                Generate travel plan from natural language prompt
-        
-                Args:
-                    prompt: Natural language travel request (e.g., "Plan a 5-day beach vacation from Mumbai under 40k")
-                    max_retries: Number of retry attempts if budget validation fails
-                """
-                print("Parsing travel request...")
+                logger.info("Parsing travel request...")
         
                 parse_task = self.tasks.parse_prompt_task(
                     agent=self.agents.prompt_parser_agent,
                     prompt=prompt
                 )
 
-                parse_crew = Crew(
-                    agents=[self.agents.prompt_parser_agent],
-                    tasks=[parse_task],
-                    process=Process.sequential,
-                    verbose=False
-                )
-
-                parse_result = parse_crew.kickoff()
-                inputs = self._parse_result(parse_result)
+                inputs = await self._execute(self.agents.prompt_parser_agent, parse_task)
 
-                print(f"Parsed request:")
-                print(f"  Budget: {inputs.get('budget')} {inputs.get('currency', 'INR')}")
-                print(f"  Duration: {inputs.get('duration')} days")
-                print(f"  Start: {inputs.get('start_city')}")
-                print(f"  Travelers: {inputs.get('people')}")
-                print(f"  Interests: {inputs.get('interests')}")
+                logger.info(
+                    "Parsed request: budget=%s %s, duration=%s days, start=%s, travelers=%s, interests=%s",
+                    inputs.get('budget'), inputs.get('currency', 'INR'), inputs.get('duration'),
+                    inputs.get('start_city'), inputs.get('people'), inputs.get('interests')
+                )
 
                 if inputs.get('missing_info'):
-                    print(f"  Note: {inputs.get('assumptions', 'Made some assumptions')}")
+                    logger.info("Note: %s", inputs.get('assumptions', 'Made some assumptions'))
+
+                if on_step:
+                    on_step({'step': 'parse', 'data': inputs})
 
-                return self.run(inputs, max_retries)
+                self.validate_inputs(inputs)
+                if self.is_simple_trip(inputs):
+                    plan = await asyncio.to_thread(self._plan_single_pass, inputs)
+                    if plan is not None:
+                        return plan
+                return await self.run_async(inputs, max_retries, on_step=on_step)
             except Exception as e:
                 if "overloaded" in str(e) or "503" in str(e):
                         if attempt < max_retries - 1:
                             wait_time = (attempt + 1) * 10
-                            print(f"Model overloaded, retrying in {wait_time} seconds... ")
-                            time.sleep(wait_time)
+                            logger.warning("Model overloaded, retrying in %s seconds...", wait_time)
+                            await asyncio.sleep(wait_time)
                             continue
                 raise
 
+    async def run_stream(self, prompt, max_retries=2):
+        """
+        Yield one event per completed pipeline step while planning from a prompt.
+
+        Step events look like {'step': 'city', 'data': {...}}; the last event is
+        {'step': 'plan', 'data': final_plan}. Planning errors are re-raised.
+        """
+        events = asyncio.Queue()
+        run = asyncio.ensure_future(self.run_from_prompt_async(prompt, max_retries, on_step=events.put_nowait))
+        run.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            yield {'step': 'plan', 'data': run.result()}
+        finally:
+            run.cancel()
+
     def run(self, inputs, max_retries=2):
+        return _run_sync(self.run_async(inputs, max_retries))
+
+    async def run_async(self, inputs, max_retries=2, on_step=None):
+        # Defaults and budget retries are applied to a copy so callers can
+        # reuse one inputs dict across runs
+        inputs = dict(inputs)
         self.validate_inputs(inputs)
         
         if 'currency' not in inputs:
@@ -152,133 +326,33 @@ class TravelPlannerFlow:
         if not feasibility['feasible']:
             raise ValueError(feasibility['message'])
         
-        print(f"\nPlanning trip from {inputs['start_city']}")
-        print(f"Budget: {inputs['budget']} {inputs['currency']}")
-        print(f"Duration: {inputs['duration']} days")
-        print(f"Travelers: {inputs['people']}")
-        print("-" * 60)
+        nodes = self._build_nodes(inputs)
+        
+        logger.info(
+            "Planning trip from %s: budget=%s %s, duration=%s days, travelers=%s",
+            inputs['start_city'], inputs['budget'], inputs['currency'],
+            inputs['duration'], inputs['people']
+        )
         
         original_budget = inputs['budget']
+        # Steps that already succeeded are kept across attempts, so a retry
+        # only re-runs what failed or what the tighter budget invalidates
+        results = {}
+        over_budget_total = None
         
         for attempt in range(max_retries):
             try:
-                print(f"\nAttempt {attempt + 1}/{max_retries}")
-                
-                print("\nStep 1: Selecting destination...")
-                city_task = self.tasks.choose_city_task(
-                    agent=self.agents.city_selector_agent,
-                    inputs=inputs
-                )
-                
-                city_crew = Crew(
-                    agents=[self.agents.city_selector_agent],
-                    tasks=[city_task],
-                    process=Process.sequential,
-                    verbose=False
-                )
-                
-                city_result = city_crew.kickoff()
-                city_data = self._parse_result(city_result)
-                destination_city = city_data.get('destination_city', 'Unknown')
-                
-                print(f"✓ Destination: {destination_city}")
-                inputs['destination_city'] = destination_city
-                
-                print(f"\nStep 2: Researching {destination_city}...")
-                research_task = self.tasks.research_city_task(
-                    agent=self.agents.local_expert_agent,
-                    city=destination_city,
-                    season=inputs['season']
-                )
-                
-                research_crew = Crew(
-                    agents=[self.agents.local_expert_agent],
-                    tasks=[research_task],
-                    process=Process.sequential,
-                    verbose=False
-                )
-                
-                research_result = research_crew.kickoff()
-                city_info = self._parse_result(research_result)
-                print(f"✓ Found {len(city_info.get('attractions', []))} attractions")
+                logger.info("Attempt %d/%d", attempt + 1, max_retries)
                 
-                print("\nStep 3: Planning transportation...")
-                transport_task = self.tasks.transport_task(
-                    agent=self.agents.transport_agent,
-                    inputs=inputs,
-                    city=destination_city
-                )
-                
-                transport_crew = Crew(
-                    agents=[self.agents.transport_agent],
-                    tasks=[transport_task],
-                    process=Process.sequential,
-                    verbose=False
-                )
-                
-                transport_result = transport_crew.kickoff()
-                transport_info = self._parse_result(transport_result)
-                print("✓ Transportation planned")
-                
-                print(f"\nStep 4: Creating {inputs['duration']}-day itinerary...")
-                itinerary_task = self.tasks.itinerary_planning_task(
-                    agent=self.agents.itinerary_agent,
-                    inputs=inputs,
-                    city_info=city_info
-                )
-                
-                itinerary_crew = Crew(
-                    agents=[self.agents.itinerary_agent],
-                    tasks=[itinerary_task],
-                    process=Process.sequential,
-                    verbose=False
-                )
+                await self._execute_dag(nodes, results, on_step=on_step)
                 
-                itinerary_result = itinerary_crew.kickoff()
-                itinerary_data = self._parse_result(itinerary_result)
-                print(f"✓ Itinerary created")
-                
-                print("\nStep 5: Planning budget...")
-                budget_task = self.tasks.budget_planning_task(
-                    agent=self.agents.budget_manager_agent,
-                    inputs=inputs,
-                    itinerary=itinerary_data,
-                    city=destination_city
-                )
-                
-                budget_crew = Crew(
-                    agents=[self.agents.budget_manager_agent],
-                    tasks=[budget_task],
-                    process=Process.sequential,
-                    verbose=False
-                )
-                
-                budget_result = budget_crew.kickoff()
-                budget_data = self._parse_result(budget_result)
-                print(f"✓ Budget: {budget_data.get('total_estimated_cost', 0)} {inputs['currency']}")
-                
-                print("\nStep 6: Validating budget...")
-                budget_check_task = self.tasks.budget_check_task(
-                    agent=self.agents.budget_checker_agent,
-                    inputs=inputs,
-                    budget_plan=budget_data,
-                    city=destination_city
-                )
-                
-                budget_check_crew = Crew(
-                    agents=[self.agents.budget_checker_agent],
-                    tasks=[budget_check_task],
-                    process=Process.sequential,
-                    verbose=False
-                )
-                
-                budget_check_result = budget_check_crew.kickoff()
-                budget_validation = self._parse_result(budget_check_result)
+                budget_data = results['budget']
+                budget_validation = results['budget_check']
                 
                 within_budget = budget_validation.get('within_budget', False)
                 computed_total = budget_validation.get('computed_total', budget_data.get('total_estimated_cost', 0))
                 
-                print(f"{'✓' if within_budget else '✗'} Total: {computed_total} {inputs['currency']}")
+                logger.info("%s Total: %s %s", '✓' if within_budget else '✗', computed_total, inputs['currency'])
                 
                 validation_result = self.validate_budget_realistic(
                     {'budget': {'plan': budget_data, 'total_cost': computed_total}},
@@ -286,90 +360,389 @@ class TravelPlannerFlow:
                 )
                 
                 if not validation_result['realistic']:
-                    print("Warning: Potential budget calculation issues detected")
-                
-                if not within_budget and attempt < max_retries - 1:
-                    print(f"\nOver budget. Retrying with adjusted constraints...")
-                    inputs['budget'] = int(original_budget * 0.85)
-                    continue
+                    logger.warning("Potential budget calculation issues detected: %s", validation_result['issues'])
                 
-                if not within_budget and attempt == max_retries - 1:
-                    raise ValueError(
-                        f"Could not generate plan within budget {original_budget} {inputs['currency']} "
-                        f"after {max_retries} attempts. Final cost: {computed_total} {inputs['currency']}."
-                    )
+                if not within_budget:
+                    tightened_budget = int(original_budget * 0.85 ** (attempt + 1))
+                    # A tightened budget below the feasibility floor can only
+                    # fail again, so give up instead of paying for the retry
+                    if (attempt < max_retries - 1
+                            and self.validate_feasibility({**inputs, 'budget': tightened_budget})['feasible']):
+                        logger.info("Over budget. Re-planning budget with adjusted constraints...")
+                        inputs['budget'] = tightened_budget
+                        results['previous_budget'] = results.pop('budget')
+                        del results['budget_check']
+                        continue
+                    over_budget_total = computed_total
+                    break
                 
-                print("\nStep 7: Finalizing plan...")
+                logger.info("Step 7: Finalizing plan...")
                 
-                final_plan = {
-                    "metadata": {
-                        "generated_at": datetime.now().isoformat(),
-                        "trip_duration": inputs['duration'],
-                        "travelers": inputs['people'],
-                        "currency": inputs['currency'],
-                        "start_city": inputs['start_city'],
-                        "attempts": attempt + 1
-                    },
-                    "destination": {
-                        "city": destination_city,
-                        "selection_reasoning": city_data.get('reasoning', ''),
-                        "research": city_info
-                    },
-                    "transportation": transport_info,
-                    "itinerary": itinerary_data,
-                    "budget": {
-                        "plan": budget_data,
-                        "validation": budget_validation,
-                        "total_cost": computed_total,
-                        "within_budget": within_budget,
-                        "budget_limit": original_budget,
-                        "realistic": validation_result['realistic'],
-                        "validation_issues": validation_result['issues']
-                    },
-                    "recommendations": budget_validation.get('recommendations', [])
-                }
+                final_plan = self._assemble_plan(
+                    inputs, results, computed_total, within_budget,
+                    validation_result, original_budget, attempts=attempt + 1
+                )
                 
-                print("\n" + "=" * 60)
-                print("✓ Travel plan complete!")
-                print("=" * 60)
+                logger.info("✓ Travel plan complete!")
                 
                 return final_plan
                 
             except Exception as e:
                 if attempt < max_retries - 1:
-                    print(f"\nError: {e}")
-                    print("Retrying...")
+                    logger.warning("Error: %s. Retrying...", e)
                     continue
                 else:
                     raise
         
+        if over_budget_total is not None:
+            raise ValueError(
+                f"Could not generate plan within budget {original_budget} {inputs['currency']} "
+                f"after {attempt + 1} attempts. Final cost: {over_budget_total} {inputs['currency']}."
+            )
         raise ValueError(f"Failed to generate plan after {max_retries} attempts")
+
+    def is_simple_trip(self, inputs):
+        return (
+            inputs['duration'] <= FAST_PATH_MAX_DURATION
+            and inputs['budget'] < FAST_PATH_MAX_BUDGET
+        )
+
+    def run_fast(self, inputs, max_retries=2):
+        """
+        Plan a short, low-budget trip with a single structured LLM call.
+
+        Falls back to the full multi-agent pipeline if the one-shot plan
+        comes back over budget or without a destination.
+        """
+        return self._plan_single_pass(inputs) or self.run(inputs, max_retries)
+
+    def _plan_single_pass(self, inputs):
+        inputs = dict(inputs)
+        self.validate_inputs(inputs)
+        
+        feasibility = self.validate_feasibility(inputs)
+        if not feasibility['feasible']:
+            raise ValueError(feasibility['message'])
+        
+        logger.info("Planning short trip from %s in a single pass...", inputs['start_city'])
+        fast_task = self.tasks.fast_plan_task(
+            agent=self.agents.trip_planner_agent,
+            inputs=TripInputs.from_dict(inputs)
+        )
+        plan_data = self._parse_result(_execute_task(fast_task, self.agents.trip_planner_agent))
+        
+        budget_data = plan_data.get('budget') or {}
+        budget_validation = self.validate_budget_plan(budget_data, inputs['budget'], inputs['currency'])
+        computed_total = budget_validation['computed_total']
+        within_budget = budget_validation['within_budget']
+        
+        if not plan_data.get('destination_city') or not within_budget or budget_validation['flags']:
+            logger.info("Single-pass plan unusable, falling back to full pipeline")
+            return None
+        
+        inputs['destination_city'] = plan_data['destination_city']
+        logger.info("✓ Destination: %s", inputs['destination_city'])
+        logger.info("✓ Total: %s %s", computed_total, inputs['currency'])
+        
+        results = {
+            'city': {'destination_city': plan_data['destination_city'], 'reasoning': plan_data.get('reasoning', '')},
+            'research': plan_data.get('research', {}),
+            'transport': plan_data.get('transportation', {}),
+            'itinerary': {'itinerary': plan_data.get('itinerary', [])},
+            'budget': budget_data,
+            'budget_check': budget_validation
+        }
+        validation_result = self.validate_budget_realistic(
+            {'budget': {'plan': budget_data, 'total_cost': computed_total}},
+            inputs
+        )
+        
+        return self._assemble_plan(
+            inputs, results, computed_total, within_budget,
+            validation_result, inputs['budget'], attempts=1
+        )
+
+    def _assemble_plan(self, inputs, results, computed_total, within_budget,
+                       validation_result, original_budget, attempts):
+        budget_validation = results['budget_check']
+        return {
+            "metadata": {
+                "generated_at": datetime.now().isoformat(),
+                "trip_duration": inputs['duration'],
+                "travelers": inputs['people'],
+                "currency": inputs['currency'],
+                "start_city": inputs['start_city'],
+                "attempts": attempts
+            },
+            "destination": {
+                "city": inputs['destination_city'],
+                "selection_reasoning": results['city'].get('reasoning', ''),
+                "research": results['research']
+            },
+            "transportation": results['transport'],
+            "itinerary": results['itinerary'],
+            "budget": {
+                "plan": results['budget'],
+                "validation": budget_validation,
+                "total_cost": computed_total,
+                "within_budget": within_budget,
+                "budget_limit": original_budget,
+                "realistic": validation_result['realistic'],
+                "validation_issues": validation_result['issues']
+            },
+            "recommendations": budget_validation.get('recommendations', [])
+        }
+
+    def _build_nodes(self, inputs):
+        """
+        Describe the planning pipeline as a dependency graph.
+
+        The graph comes from tasks.PIPELINE_STEPS; each node pairs a step's
+        dependencies with the coroutine that builds and runs its task.
+        """
+        async def select_city(results):
+            logger.info("Step 1: Selecting destination...")
+            city_task = partial(
+                self.tasks.choose_city_task,
+                agent=self.agents.city_selector_agent,
+                inputs=TripInputs.from_dict(inputs)
+            )
+            city_key = make_cache_key(
+                'city',
+                model=self.agents.model,
+                interests=inputs['interests'],
+                budget=inputs['budget'],
+                duration=inputs['duration'],
+                start_city=inputs['start_city'],
+                season=inputs['season'],
+                people=inputs['people']
+            )
+            # Every field but the free-text interests must match exactly
+            city_data = await self._execute(
+                self.agents.city_selector_agent, city_task, cache_key=city_key, fuzzy=True
+            )
+            inputs['destination_city'] = city_data.get('destination_city', 'Unknown')
+            logger.info("✓ Destination: %s", inputs['destination_city'])
+            return city_data
+
+        async def research_city(results):
+            logger.info("Step 2: Researching %s...", inputs['destination_city'])
+            research_task = partial(
+                self.tasks.research_city_task,
+                agent=self.agents.local_expert_agent,
+                city=inputs['destination_city'],
+                season=inputs['season']
+            )
+            research_key = make_cache_key(
+                'research',
+                model=self.agents.model,
+                city=inputs['destination_city'],
+                season=inputs['season']
+            )
+            city_info = await self._execute(self.agents.local_expert_agent, research_task, cache_key=research_key)
+            logger.info("✓ Found %d attractions", len(city_info.get('attractions', [])))
+            # Serialized once here so every prompt that needs the city context
+            # (and every retry of those steps) embeds the same bytes
+            results['research_json'] = orjson.dumps(city_info, option=orjson.OPT_SORT_KEYS).decode()
+            return city_info
+
+        async def plan_transport(results):
+            logger.info("Step 3: Planning transportation...")
+            transport_task = partial(
+                self.tasks.transport_task,
+                agent=self.agents.transport_agent,
+                inputs=TripInputs.from_dict(inputs),
+                city=inputs['destination_city']
+            )
+            transport_key = make_cache_key(
+                'transport',
+                model=self.agents.model,
+                start_city=inputs['start_city'],
+                city=inputs['destination_city']
+            )
+            transport_info = await self._execute(self.agents.transport_agent, transport_task, cache_key=transport_key)
+            logger.info("✓ Transportation planned")
+            return transport_info
+
+        async def plan_itinerary(results):
+            logger.info("Step 4: Creating %s-day itinerary...", inputs['duration'])
+            itinerary_task = partial(
+                self.tasks.itinerary_planning_task,
+                agent=self.agents.itinerary_agent,
+                inputs=TripInputs.from_dict(inputs),
+                city_info=results['research_json']
+            )
+            # Research is itself cached per city and season, so trips with the
+            # same shape get the same itinerary
+            itinerary_key = make_cache_key(
+                'itinerary',
+                model=self.agents.model,
+                city=inputs['destination_city'],
+                duration=inputs['duration'],
+                interests=inputs['interests'],
+                season=inputs['season'],
+                budget=inputs['budget'],
+                currency=inputs['currency']
+            )
+            itinerary_data = await self._execute(self.agents.itinerary_agent, itinerary_task, cache_key=itinerary_key)
+            logger.info("✓ Itinerary created")
+            return itinerary_data
+
+        async def plan_budget(results):
+            logger.info("Step 5: Planning budget...")
+            budget_task = self.tasks.budget_planning_task(
+                agent=self.agents.budget_manager_agent,
+                inputs=TripInputs.from_dict(inputs),
+                itinerary=results['itinerary'],
+                city=inputs['destination_city'],
+                previous_plan=results.get('previous_budget')
+            )
+            # The transport step's recommendations reach the budget agent as
+            # task context, so round-trip fares are priced for the chosen modes
+            budget_data = await self._execute(
+                self.agents.budget_manager_agent,
+                budget_task,
+                context=orjson.dumps({'transportation': results['transport']}).decode()
+            )
+            logger.info("✓ Budget: %s %s", budget_data.get('total_estimated_cost', 0), inputs['currency'])
+            return budget_data
+
+        async def check_budget(results):
+            logger.info("Step 6: Validating budget...")
+            budget_validation = self.validate_budget_plan(results['budget'], inputs['budget'], inputs['currency'])
+            if not budget_validation['flags']:
+                return budget_validation
+            
+            logger.info("Budget items inconsistent (%s), asking budget checker...", "; ".join(budget_validation['flags']))
+            budget_check_task = self.tasks.budget_check_task(
+                agent=self.agents.budget_checker_agent,
+                inputs=TripInputs.from_dict(inputs),
+                budget_plan=results['budget'],
+                city=inputs['destination_city']
+            )
+            return await self._execute(self.agents.budget_checker_agent, budget_check_task)
+
+        runners = {
+            'city': select_city,
+            'research': research_city,
+            'transport': plan_transport,
+            'itinerary': plan_itinerary,
+            'budget': plan_budget,
+            'budget_check': check_budget,
+        }
+        return {name: {'deps': deps, 'run': runners[name]} for name, deps in PIPELINE_STEPS.items()}
+
+    async def _execute_dag(self, nodes, results, on_step=None):
+        """
+        Run every node as soon as all of its dependencies have resolved.
+
+        Results are written into ``results`` as nodes finish; nodes already
+        present there are not run again.
+        """
+        pending = {name: node for name, node in nodes.items() if name not in results}
+        running = {}
+
+        def collect(done):
+            # Store each finished step's result, returning the first failure
+            failure = None
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logger.warning("Step %s failed: %s", name, e)
+                    if on_step:
+                        on_step({'step': name, 'status': 'failed', 'error': str(e)})
+                    failure = failure or e
+                    continue
+                if on_step:
+                    on_step({'step': name, 'data': results[name]})
+            return failure
+
+        try:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if all(dep in results for dep in node['deps']):
+                        running[asyncio.ensure_future(node['run'](results))] = name
+                        del pending[name]
+
+                if not running:
+                    raise ValueError(f"Unresolvable step dependencies: {', '.join(pending)}")
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                failure = collect(done)
+                if failure:
+                    # Cancelling a sibling would not stop its worker thread,
+                    # only throw its answer away; let it finish so the caller's
+                    # retry finds it in results
+                    if running:
+                        done, _ = await asyncio.wait(running)
+                        collect(done)
+                    raise failure
+        finally:
+            for future in running:
+                future.cancel()
+
+        return results
+
+    async def _execute(self, agent, task, cache_key=None, context=None, fuzzy=False):
+        """
+        Run a task on its agent and parse the JSON it returns.
+
+        ``task`` may be a zero-argument callable that builds the Task, so
+        steps served from the cache never construct one. The cache serves an
+        exact ``cache_key`` match, or with ``fuzzy`` one whose interests are
+        merely similar (see SemanticCache).
+        """
+        # The cache only saves calls; a failing cache must never fail a step
+        if cache_key:
+            try:
+                cached = await asyncio.to_thread(self.cache.get, cache_key, fuzzy)
+            except Exception as e:
+                logger.warning("Cache read failed for %s: %s", cache_key.split("|", 1)[0], e)
+                cached = None
+            if cached is not None:
+                return cached
+
+        if callable(task):
+            task = task()
+
+        # Tasks run directly on their agent; wrapping each one in a throwaway
+        # single-agent Crew only added setup cost. CrewAI is blocking, so
+        # every task gets its own worker thread.
+        result = await asyncio.to_thread(_execute_task, task, agent, context)
+        parsed = self._parse_result(result)
+
+        if cache_key and 'raw_output' not in parsed:
+            try:
+                await asyncio.to_thread(self.cache.set, cache_key, parsed, fuzzy)
+            except Exception as e:
+                logger.warning("Cache write failed for %s: %s", cache_key.split("|", 1)[0], e)
+        return parsed
     
     def _parse_result(self, result):
+        raw = getattr(result, 'raw', None) or getattr(result, 'output', None) or str(result)
+        payload = raw.lstrip()
+        # Agents in JSON mode answer with bare JSON; only look for a fenced
+        # block when the output starts with anything else
+        if payload[:1] not in ('{', '['):
+            match = _JSON_FENCE.search(raw)
+            payload = match.group(1) if match else raw
+
         try:
-            if hasattr(result, 'raw'):
-                result_str = result.raw
-            elif hasattr(result, 'output'):
-                result_str = result.output
-            else:
-                result_str = str(result)
-            
-            if '```json' in result_str:
-                json_str = result_str.split('```json')[1].split('```')[0].strip()
-            elif '```' in result_str:
-                json_str = result_str.split('```')[1].split('```')[0].strip()
-            else:
-                json_str = result_str
-            
-            return json.loads(json_str)
-        except (json.JSONDecodeError, IndexError, AttributeError) as e:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
             try:
                 from json_repair import repair_json
-                return json.loads(repair_json(json_str))
-            except:
-                return {"raw_output": str(result)}
+                return orjson.loads(repair_json(payload))
+            except Exception:
+                return {"raw_output": raw}
     
     def save_plan(self, plan, filename="travel_plan.json"):
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(plan, f, indent=2, ensure_ascii=False)
-        print(f"\nPlan saved to {filename}")
\ No newline at end of file
+        # orjson writes UTF-8 without escaping non-ASCII, like ensure_ascii=False
+        with open(filename, 'wb') as f:
+            f.write(orjson.dumps(plan, option=orjson.OPT_INDENT_2))
+        logger.info("Plan saved to %s", filename)
+
+    async def save_plan_async(self, plan, filename="travel_plan.json"):
+        await asyncio.to_thread(self.save_plan, plan, filename)
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import orjson
+
+DB_PATH = os.getenv("ITINERA_DB_PATH", "itinera.db")
+
+_local = threading.local()
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans ("
+            "id TEXT PRIMARY KEY, data BLOB NOT NULL, etag TEXT NOT NULL, created_at TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_created_at ON plans(created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, data BLOB NOT NULL, created_at TEXT NOT NULL, completed_at TEXT)"
+        )
+        _local.conn = conn
+    return conn
+
+
+def get_plan_blob(plan_id):
+    """Return the stored (JSON bytes, etag) pair for a plan, or None."""
+    row = _connect().execute("SELECT data, etag FROM plans WHERE id = ?", (plan_id,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def put_plan(plan_id, plan):
+    data = orjson.dumps(plan)
+    etag = f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+    _connect().execute(
+        "INSERT OR REPLACE INTO plans (id, data, etag, created_at) VALUES (?, ?, ?, ?)",
+        (plan_id, data, etag, plan.get("created_at") or datetime.now().isoformat())
+    )
+
+
+def delete_plan(plan_id):
+    cursor = _connect().execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+    return cursor.rowcount > 0
+
+
+def list_plans(limit=10):
+    """Return the most recent plans, oldest first."""
+    rows = _connect().execute(
+        "SELECT data FROM plans ORDER BY created_at DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [orjson.loads(row[0]) for row in reversed(rows)]
+
+
+def get_job(job_id):
+    row = _connect().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+
+def put_job(job_id, job):
+    _connect().execute(
+        "INSERT OR REPLACE INTO jobs (id, data, created_at, completed_at) VALUES (?, ?, ?, ?)",
+        (job_id, orjson.dumps(job), job["created_at"], job.get("completed_at"))
+    )
+
+
+def update_job(job_id, **fields):
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(job_id)
+        job = orjson.loads(row[0])
+        job.update(fields)
+        conn.execute(
+            "UPDATE jobs SET data = ?, completed_at = ? WHERE id = ?",
+            (orjson.dumps(job), job.get("completed_at"), job_id)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return job
@@ -1,231 +1,452 @@
 from crewai import Task
-import json
+from dataclasses import dataclass
+from operator import itemgetter
+from pydantic import BaseModel
+from typing import Literal, Optional, get_args, get_origin
+import orjson
+import sys
 
-class ItineraTasks:
-    def __init__(self):
-        pass
-
-    def _make_task(self, description: str, agent, expected_output: str, context=None):
-        task_params = {
-            'description': description.strip(),
-            'expected_output': expected_output.strip(),
-            'agent': agent
-        }
-        
-        if context:
-            task_params['context'] = context
-            
-        return Task(**task_params)
-
-    def parse_prompt_task(self, agent, prompt):
-        description = f"""
-        Parse this natural language travel request and extract structured information:
-        
-        "{prompt}"
-        
-        Extract:
-        - Budget: Total amount in INR (if not specified, ask user or estimate based on trip type)
-        - Duration: Number of days
-        - Start city: Departure location
-        - Interests: Activities, experiences, or trip type (e.g., adventure, culture, relaxation)
-        - Season: When they want to travel (current season if not specified)
-        - People: Number of travelers (default to 1 if not mentioned)
-        
-        If critical information is missing, make reasonable assumptions based on context.
-        """
-        
-        expected_output = """
-        {
-            "budget": number,
-            "duration": number,
-            "start_city": "string",
-            "interests": "string",
-            "season": "summer/winter/monsoon/spring/autumn",
-            "people": number,
-            "currency": "INR",
-            "missing_info": ["list of any critical missing information"],
-            "assumptions": "string explaining any assumptions made"
-        }
-        """
-        
-        return self._make_task(description, agent, expected_output)
-
-    def choose_city_task(self, agent, inputs):
-        description = f"""
-        Select an affordable and realistic destination based on:
-        - Interests: {inputs['interests']}
-        - Budget: {inputs['budget']} {inputs.get('currency', 'INR')}
-        - Duration: {inputs['duration']} days
-        - Start city: {inputs['start_city']}
-        - Season: {inputs['season']}
-        - People: {inputs['people']}
-        
-        Consider distance, accommodation costs, and local prices.
-        """
-        
-        expected_output = """
-        {
-            "destination_city": "string",
-            "reasoning": "string"
-        }
-        """
-        
-        return self._make_task(description, agent, expected_output)
-
-    def research_city_task(self, agent, city, season):
-        description = f"""
-        Research {city} for {season} travel:
-        - Top attractions and landmarks
-        - Local food and cuisine highlights
-        - Cultural experiences and seasonal events
-        - Local customs and etiquette
-        - Transportation and safety tips
-        """
-        
-        expected_output = """
-        {
-            "attractions": ["string"],
-            "cuisine": ["string"],
-            "cultural_norms": ["string"],
-            "transportation_tips": ["string"],
-            "local_activities": ["string"]
-        }
-        """
-        
-        return self._make_task(description, agent, expected_output)
+# Planning steps in pipeline order, each with the steps whose results its
+# task is built from. Steps whose dependencies have all resolved are
+# independent and can run concurrently (research and transport, for one).
+PIPELINE_STEPS = {
+    'city': (),
+    'research': ('city',),
+    'transport': ('city',),
+    'itinerary': ('research',),
+    'budget': ('itinerary', 'transport'),
+    'budget_check': ('budget',),
+}
+
+# Budget plan fields that neither the checker nor a budget revision needs
+_BUDGET_PROMPT_SKIP_FIELDS = frozenset({'cost_cutting_suggestions', 'budget_status'})
+
+
+def _minify_for_prompt(obj, drop=frozenset()):
+    """
+    Serialize obj as compact JSON for a prompt, leaving out ``drop`` keys at any depth.
+
+    Keys are sorted so the same data always renders to the same bytes. A str
+    is taken to be JSON the caller already serialized and is used as is.
+    """
+    if isinstance(obj, str):
+        return obj
+
+    def strip(value):
+        if isinstance(value, dict):
+            return {k: strip(v) for k, v in value.items() if k not in drop}
+        if isinstance(value, list):
+            return [strip(v) for v in value]
+        return value
+
+    return orjson.dumps(strip(obj) if drop else obj, option=orjson.OPT_SORT_KEYS).decode()
+
+
+# JSON shapes each agent is asked to return. _BUDGET_CHECK_SCHEMA is a
+# format string with a {currency} field, hence its doubled braces.
+_PARSE_PROMPT_SCHEMA = """\
+{
+    "budget": number,
+    "duration": number,
+    "start_city": "string",
+    "interests": "string",
+    "season": "summer/winter/monsoon/spring/autumn",
+    "people": number,
+    "currency": "INR",
+    "missing_info": ["list of any critical missing information"],
+    "assumptions": "string explaining any assumptions made"
+}"""
+
+_CHOOSE_CITY_SCHEMA = """\
+{
+    "destination_city": "string",
+    "reasoning": "string"
+}"""
+
+_BUDGET_CHECK_SCHEMA = """\
+{{
+    "currency": "{currency}",
+    "verified_at": "ISO8601 timestamp",
+    "categories": {{
+        "accommodation": [...],
+        "transportation": [...],
+        "activities": [...],
+        "meals": [...],
+        "emergency_fund": {{}},
+        "visa_fees": {{}}
+    }},
+    "computed_total": number,
+    "original_total_in_plan": number,
+    "discrepancy": number,
+    "within_budget": boolean,
+    "over_by": number,
+    "flags": [...],
+    "recommendations": [...]
+}}"""
+
+class CityResearch(BaseModel):
+    attractions: list[str]
+    cuisine: list[str]
+    cultural_norms: list[str]
+    transportation_tips: list[str]
+    local_activities: list[str]
+
+
+class TransportOptions(BaseModel):
+    long_distance_options: list[str]
+    local_transport_options: list[str]
+    reasoning: str
+
+
+class Activity(BaseModel):
+    activity: str
+    time: str
+    location: str
+    description: str
+    transportation: str
+
+
+class DayPlan(BaseModel):
+    day: int
+    activities: list[Activity]
+
+
+class ItineraryPlan(BaseModel):
+    itinerary: list[DayPlan]
+
+
+class CostItem(BaseModel):
+    description: str
+    cost: float
+    calculation: str
+
+
+class MealCost(BaseModel):
+    type: str
+    cost: float
+    calculation: str
+
+
+class ActivityCost(BaseModel):
+    name: str
+    cost: float
+    calculation: str
+
+
+class FixedCost(BaseModel):
+    description: str
+    cost: float
+
+
+class BudgetPlan(BaseModel):
+    transportation: list[CostItem]
+    accommodation: list[CostItem]
+    meals: list[MealCost]
+    activities: list[ActivityCost]
+    emergency_fund: FixedCost
+    visa_fees: FixedCost
+    total_estimated_cost: float
+    budget_status: Literal['within', 'over']
+    cost_cutting_suggestions: list[str]
+
+
+class FastPlan(BaseModel):
+    """Everything the single-pass planner returns in one response."""
+    destination_city: str
+    reasoning: str
+    research: CityResearch
+    transportation: TransportOptions
+    itinerary: list[DayPlan]
+    budget: BudgetPlan
+
+
+_NUMBER = '<number>'
 
-    def itinerary_planning_task(self, agent, inputs, city_info):
-        description = f"""
-        Create a {inputs['duration']}-day itinerary for {inputs['destination_city']}.
-        
-        Budget: {inputs['budget']} {inputs.get('currency', 'INR')}
-        Interests: {inputs['interests']}
-        Season: {inputs['season']}
-        
-        City Information:
-        {json.dumps(city_info, indent=2)}
-        
-        Include day-by-day activities, sightseeing, transportation, and meal recommendations.
-        """
-        
-        expected_output = """
-        {
-            "itinerary": [
-                {
-                    "day": number,
-                    "activities": [
-                        {
-                            "activity": "string",
-                            "time": "string",
-                            "location": "string",
-                            "description": "string",
-                            "transportation": "string"
-                        }
-                    ]
-                }
-            ]
-        }
-        """
-        
-        return self._make_task(description, agent, expected_output)
 
-    def budget_planning_task(self, agent, inputs, itinerary, city):
-        description = f"""
-        Create detailed budget for {inputs['duration']}-day trip for {inputs['people']} people 
-        from {inputs['start_city']} to {city}.
-        Max budget: {inputs['budget']} {inputs.get('currency', 'INR')}.
+def _shape(annotation):
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return {name: _shape(field.annotation) for name, field in annotation.model_fields.items()}
+    if get_origin(annotation) is list:
+        return [_shape(get_args(annotation)[0])]
+    if get_origin(annotation) is Literal:
+        return '/'.join(get_args(annotation))
+    if annotation in (int, float):
+        return _NUMBER
+    return 'string'
 
-        Calculate with itemized breakdown:
 
-        1. TRANSPORTATION:
-           - Round trip: [mode] × {inputs['people']} = X INR
-           - Local transport: Y INR × {inputs['duration']} days = Z INR
+def _describe(model):
+    """Render the JSON shape of a model the way the prompt schemas are written."""
+    rendered = orjson.dumps(_shape(model), option=orjson.OPT_INDENT_2).decode()
+    return rendered.replace(f'"{_NUMBER}"', 'number')
 
-        2. ACCOMMODATION:
-           - Per night: A INR × {inputs['duration']} nights = B INR
 
-        3. MEALS:
-           - Breakfast: {inputs['people']} × {inputs['duration']} × 150 = X INR
-           - Lunch: {inputs['people']} × {inputs['duration']} × 250 = Y INR
-           - Dinner: {inputs['people']} × {inputs['duration']} × 300 = Z INR
+# The steps whose output the single-pass plan also returns take their
+# schemas from the same models, so the two can't drift apart
+_RESEARCH_CITY_SCHEMA = _describe(CityResearch)
+_TRANSPORT_SCHEMA = _describe(TransportOptions)
+_ITINERARY_SCHEMA = _describe(ItineraryPlan)
+_BUDGET_PLAN_SCHEMA = _describe(BudgetPlan)
+_FAST_PLAN_SCHEMA = _describe(FastPlan)
 
-        4. ACTIVITIES: [List each with cost × {inputs['people']}]
 
-        5. EMERGENCY FUND: 10% of total
+# Task descriptions are rendered with str.format_map from these templates.
+# Each one opens with its fixed instructions and ends with the per-trip
+# details, so repeated calls share a byte-identical prompt prefix that
+# provider-side prompt caches can reuse. They are written flush-left so no
+# indentation is sent to the model.
+_PARSE_PROMPT_TEMPLATE = """\
+Parse the natural language travel request below and extract structured information.
 
-        6. VISA FEES: 0 INR (domestic)
+Extract:
+- Budget: Total amount in INR (if not specified, ask user or estimate based on trip type)
+- Duration: Number of days
+- Start city: Departure location
+- Interests: Activities, experiences, or trip type (e.g., adventure, culture, relaxation)
+- Season: When they want to travel (current season if not specified)
+- People: Number of travelers (default to 1 if not mentioned)
 
-        Use CURRENT realistic prices. Show calculations. If over budget, suggest cost-cutting measures.
-        """
+If critical information is missing, make reasonable assumptions based on context.
+
+Request:
+\"{prompt}\""""
+
+_CHOOSE_CITY_TEMPLATE = """\
+Select an affordable and realistic destination for the trip below.
+Consider distance, accommodation costs, and local prices.
+
+Trip:
+- Interests: {trip.interests}
+- Budget: {trip.budget} {trip.currency}
+- Duration: {trip.duration} days
+- Start city: {trip.start_city}
+- Season: {trip.season}
+- People: {trip.people}"""
+
+_RESEARCH_CITY_TEMPLATE = """\
+Research the destination below for travel in the given season:
+- Top attractions and landmarks
+- Local food and cuisine highlights
+- Cultural experiences and seasonal events
+- Local customs and etiquette
+- Transportation and safety tips
+
+Destination: {city}
+Season: {season}"""
+
+_ITINERARY_TEMPLATE = """\
+Create a day-by-day itinerary for the trip below, using the city information provided.
+Include day-by-day activities, sightseeing, transportation, and meal recommendations.
+
+Destination: {trip.destination_city}
+Duration: {trip.duration} days
+Budget: {trip.budget} {trip.currency}
+Interests: {trip.interests}
+Season: {trip.season}
+
+City Information:
+{city_info}"""
+
+# The budget prompt is assembled from sections joined by blank lines: the
+# static instructions, the trip, and on a retry the plan being revised
+_BUDGET_PLAN_INSTRUCTIONS = """\
+Create a detailed budget for the trip below.
+
+Calculate with itemized breakdown:
+
+1. TRANSPORTATION:
+   - Round trip: [mode] × people = X INR
+   - Local transport: Y INR × days = Z INR
+
+2. ACCOMMODATION:
+   - Per night: A INR × nights = B INR
+
+3. MEALS:
+   - Breakfast: people × days × 150 = X INR
+   - Lunch: people × days × 250 = Y INR
+   - Dinner: people × days × 300 = Z INR
+
+4. ACTIVITIES: [List each with cost × people]
+
+5. EMERGENCY FUND: 10% of total
+
+6. VISA FEES: 0 INR (domestic)
+
+Use CURRENT realistic prices. Show calculations. If over budget, suggest cost-cutting measures."""
+
+_BUDGET_TRIP_TEMPLATE = """\
+Trip:
+- From: {trip.start_city}
+- To: {city}
+- Duration: {trip.duration} days ({trip.duration} nights)
+- People: {trip.people}
+- Max budget: {trip.budget} {trip.currency}"""
+
+_BUDGET_REVISION_TEMPLATE = """\
+A previous budget plan for this trip came to {previous_total} {trip.currency}
+and exceeded the limit. Revise it instead of starting over: keep the items that fit,
+cut or replace the most expensive ones, and recompute every total.
+
+Previous Plan:
+{previous_plan}"""
+
+_BUDGET_CHECK_TEMPLATE = """\
+Verify the budget plan below against its limit.
+Check all categories and return corrected totals if discrepancies found.
+
+Trip: {trip.duration} days for {trip.people} people from {trip.start_city} to {city}.
+Budget limit: {trip.budget} {trip.currency}.
+
+Budget Plan:
+{budget_plan}"""
+
+_TRANSPORT_TEMPLATE = """\
+Recommend transportation options for the route below.
+
+Evaluate cost, convenience, and travel time for:
+- Long-distance travel to destination
+- Local transportation within city
+
+From: {start_city}
+To: {city}"""
+
+_FAST_PLAN_TEMPLATE = """\
+Plan a complete trip for the request below.
+
+In one pass:
+1. Select an affordable, realistic destination reachable from the start city.
+2. Research its top attractions, local food, and cultural norms for the season.
+3. Recommend long-distance and local transportation.
+4. Create a day-by-day itinerary.
+5. Build an itemized budget using CURRENT realistic prices and keep the total within the budget.
+
+Return only JSON matching the expected output.
+
+Trip:
+- Start city: {trip.start_city}
+- Duration: {trip.duration} days
+- People: {trip.people}
+- Interests: {trip.interests}
+- Budget: {trip.budget} {trip.currency} in total
+- Season: {trip.season}"""
+
+
+_REQUIRED_TRIP_FIELDS = itemgetter('budget', 'duration', 'start_city', 'interests', 'season', 'people')
+
+
+@dataclass(slots=True, frozen=True)
+class TripInputs:
+    """The trip fields task prompts are rendered from, normalized once."""
+    budget: int
+    duration: int
+    start_city: str
+    interests: str
+    season: str
+    people: int
+    currency: str = 'INR'
+    destination_city: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, inputs):
+        budget, duration, start_city, interests, season, people = _REQUIRED_TRIP_FIELDS(inputs)
+        destination_city = inputs.get('destination_city')
+        # Cities, seasons and currencies come from a small set of values that
+        # recur across requests; interning shares one copy of each and lets
+        # comparisons of equal instances short-circuit on identity
+        return cls(
+            budget=budget,
+            duration=duration,
+            start_city=sys.intern(start_city),
+            interests=interests,
+            season=sys.intern(season),
+            people=people,
+            currency=sys.intern(inputs.get('currency') or 'INR'),
+            destination_city=sys.intern(destination_city) if destination_city else None
+        )
+
+
+def _make_task(description: str, agent, expected_output: str, context=None, response_model=None):
+    # Templates and schemas are defined without surrounding whitespace, so
+    # rendered text is passed through as is
+    task_params = {
+        'description': description,
+        'expected_output': expected_output,
+        'agent': agent
+    }
+    
+    if context:
+        task_params['context'] = context
+    if response_model:
+        task_params['response_model'] = response_model
         
-        expected_output = """
-        {
-            "transportation": [{"description": "string", "cost": number, "calculation": "string"}],
-            "accommodation": [{"description": "string", "cost": number, "calculation": "string"}],
-            "meals": [{"type": "string", "cost": number, "calculation": "string"}],
-            "activities": [{"name": "string", "cost": number, "calculation": "string"}],
-            "emergency_fund": {"description": "string", "cost": number},
-            "visa_fees": {"description": "string", "cost": number},
-            "total_estimated_cost": number,
-            "budget_status": "within/over",
-            "cost_cutting_suggestions": ["string"]
-        }
-        """
+    return Task(**task_params)
+
+
+class ItineraTasks:
+    """Task factories for each planning step. Holds no state."""
+
+    __slots__ = ()
+
+    @staticmethod
+    def parse_prompt_task(agent, prompt):
+        description = _PARSE_PROMPT_TEMPLATE.format_map({'prompt': prompt})
+        
+        return _make_task(description, agent, _PARSE_PROMPT_SCHEMA)
+
+    @staticmethod
+    def choose_city_task(agent, inputs):
+        description = _CHOOSE_CITY_TEMPLATE.format_map({'trip': inputs})
         
-        return self._make_task(description, agent, expected_output)
+        return _make_task(description, agent, _CHOOSE_CITY_SCHEMA)
 
-    def budget_check_task(self, agent, inputs, budget_plan, city):
-        currency = inputs.get("currency", "INR")
-        description = f"""
-        Verify budget plan for {inputs['duration']}-day trip for {inputs['people']} people 
-        from {inputs['start_city']} to {city}.
-        Budget limit: {inputs['budget']} {currency}.
+    @staticmethod
+    def research_city_task(agent, city, season):
+        description = _RESEARCH_CITY_TEMPLATE.format_map({'city': city, 'season': season})
+        
+        return _make_task(description, agent, _RESEARCH_CITY_SCHEMA)
 
-        Budget Plan:
-        {json.dumps(budget_plan, indent=2)}
+    @staticmethod
+    def itinerary_planning_task(agent, inputs, city_info):
+        description = _ITINERARY_TEMPLATE.format_map({'trip': inputs, 'city_info': _minify_for_prompt(city_info)})
+        
+        return _make_task(description, agent, _ITINERARY_SCHEMA)
 
-        Check all categories and return corrected totals if discrepancies found.
-        """
+    @staticmethod
+    def budget_planning_task(agent, inputs, itinerary, city, previous_plan=None):
+        sections = [
+            _BUDGET_PLAN_INSTRUCTIONS,
+            _BUDGET_TRIP_TEMPLATE.format_map({'trip': inputs, 'city': city})
+        ]
         
-        expected_output = f"""
-        {{
-            "currency": "{currency}",
-            "verified_at": "ISO8601 timestamp",
-            "categories": {{
-                "accommodation": [...],
-                "transportation": [...],
-                "activities": [...],
-                "meals": [...],
-                "emergency_fund": {{}},
-                "visa_fees": {{}}
-            }},
-            "computed_total": number,
-            "original_total_in_plan": number,
-            "discrepancy": number,
-            "within_budget": boolean,
-            "over_by": number,
-            "flags": [...],
-            "recommendations": [...]
-        }}
-        """
+        if previous_plan:
+            sections.append(_BUDGET_REVISION_TEMPLATE.format_map({
+                'trip': inputs,
+                'previous_total': previous_plan.get('total_estimated_cost'),
+                'previous_plan': _minify_for_prompt(previous_plan, drop=_BUDGET_PROMPT_SKIP_FIELDS)
+            }))
         
-        return self._make_task(description, agent, expected_output)
+        return _make_task("\n\n".join(sections), agent, _BUDGET_PLAN_SCHEMA)
 
-    def transport_task(self, agent, inputs, city):
-        description = f"""
-        Recommend transportation options from {inputs['start_city']} to {city}.
+    @staticmethod
+    def budget_check_task(agent, inputs, budget_plan, city):
+        description = _BUDGET_CHECK_TEMPLATE.format_map({
+            'trip': inputs,
+            'city': city,
+            'budget_plan': _minify_for_prompt(budget_plan, drop=_BUDGET_PROMPT_SKIP_FIELDS)
+        })
         
-        Evaluate cost, convenience, and travel time for:
-        - Long-distance travel to destination
-        - Local transportation within city
-        """
+        expected_output = _BUDGET_CHECK_SCHEMA.format_map({'currency': inputs.currency})
         
-        expected_output = """
-        {
-            "long_distance_options": ["string"],
-            "local_transport_options": ["string"],
-            "reasoning": "string"
-        }
-        """
+        return _make_task(description, agent, expected_output)
+
+    @staticmethod
+    def transport_task(agent, inputs, city):
+        description = _TRANSPORT_TEMPLATE.format_map({'start_city': inputs.start_city, 'city': city})
+        
+        return _make_task(description, agent, _TRANSPORT_SCHEMA)
+
+    @staticmethod
+    def fast_plan_task(agent, inputs):
+        description = _FAST_PLAN_TEMPLATE.format_map({'trip': inputs})
         
-        return self._make_task(description, agent, expected_output)
\ No newline at end of file
+        return _make_task(description, agent, _FAST_PLAN_SCHEMA, response_model=FastPlan)